@@ -1,20 +1,60 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 import os
-import json
+import orjson
 from pydantic import BaseModel, Field
 import httpx
 import logging
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict, Any
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="FastAPI Service")
-
 # Message broker configuration
 BROKER_URL = os.getenv("BROKER_URL", "http://localhost:8080")
 
+# Processed messages are queued and sent to the broker in batches of up to
+# BROKER_BATCH_SIZE; whatever queued up while the last batch was in flight
+# goes out together. The queue is bounded so a slow broker sheds load with
+# a 503 instead of buffering without limit
+BROKER_BATCH_SIZE = 64
+BROKER_QUEUE_SIZE = 10000
+broker_queue = asyncio.Queue(maxsize=BROKER_QUEUE_SIZE)
+
+# A batch that fails with a transport error or 5xx (e.g. a cold-starting
+# broker) is retried this many times in total, waiting BROKER_RETRY_BACKOFF
+# seconds before the first retry and doubling after each, before it is dropped
+BROKER_SEND_ATTEMPTS = 4
+BROKER_RETRY_BACKOFF = 0.5
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One HTTP client for the whole process, shared by the broker flusher
+    # and the development test endpoints
+    client = app.state.http = httpx.AsyncClient(
+        base_url=BROKER_URL,
+        http2=True,
+        timeout=httpx.Timeout(5.0),
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=200, keepalive_expiry=30)
+    )
+    flusher = asyncio.create_task(broker_flusher(client))
+    yield
+    # Give the flusher a chance to send anything still queued
+    try:
+        await asyncio.wait_for(broker_queue.join(), timeout=5.0)
+    except asyncio.TimeoutError:
+        logger.warning("Dropping %s queued messages on shutdown", broker_queue.qsize())
+    flusher.cancel()
+    await asyncio.gather(flusher, return_exceptions=True)
+    await client.aclose()
+
+app = FastAPI(title="FastAPI Service", lifespan=lifespan)
+
+# Content type for the orjson-encoded batches sent to the broker
+JSON_HEADERS = {"Content-Type": "application/json"}
+
 # Check if we're in a local development environment
 IS_LOCAL_DEV = os.getenv("ENVIRONMENT", "production").lower() == "development"
 
@@ -22,6 +62,12 @@ class Message(BaseModel):
     content: str
     user_id: Optional[str] = None
 
+class RootResponse(BaseModel):
+    message: str
+
+class ProcessResponse(BaseModel):
+    processed: str
+
 # Travel-related models
 class TravelItem(BaseModel):
     id: str
@@ -43,188 +89,214 @@ class UserSettings(BaseModel):
     user_id: str
     settings: Dict[str, str]
     
-@app.get("/")
-async def root():
-    return {"message": "FastAPI Service v1.6 is running"}
-
-# Travel-related endpoints
-@app.get("/api/travel/menu", response_model=TravelMenu, tags=["travel"])
-async def get_travel_menu():
-    """Get the travel menu with all categories and items."""
-    return {
-        "categories": [
-            {
-                "id": "destinations",
-                "name": "Popular Destinations",
-                "description": "Explore some of the world's most iconic cities and breathtaking landscapes.",
-                "items": [
-                    {
-                        "id": "paris",
-                        "name": "Paris",
-                        "description": "The City of Light"
-                    },
-                    {
-                        "id": "tokyo",
-                        "name": "Tokyo",
-                        "description": "Modern meets traditional"
-                    },
-                    {
-                        "id": "nyc",
-                        "name": "New York",
-                        "description": "The Big Apple"
-                    }
-                ]
-            },
-            {
-                "id": "activities",
-                "name": "Activities",
-                "description": "Enhance your travel experience with these unforgettable activities.",
-                "items": [
-                    {
-                        "id": "tours",
-                        "name": "Guided Tours",
-                        "description": "Explore with local experts"
-                    },
-                    {
-                        "id": "adventure",
-                        "name": "Adventure Sports",
-                        "description": "For thrill seekers"
-                    },
-                    {
-                        "id": "culinary",
-                        "name": "Culinary Experiences",
-                        "description": "Taste local flavors"
-                    }
-                ]
-            },
-            {
-                "id": "accommodations",
-                "name": "Accommodations",
-                "description": "Find the perfect place to stay for your travel style and budget.",
-                "items": [
-                    {
-                        "id": "hotels",
-                        "name": "Hotels",
-                        "description": "From budget to luxury"
-                    },
-                    {
-                        "id": "rentals",
-                        "name": "Vacation Rentals",
-                        "description": "Homes away from home"
-                    },
-                    {
-                        "id": "unique",
-                        "name": "Unique Stays",
-                        "description": "Treehouses, igloos, and more"
-                    }
-                ]
-            }
-        ]
-    }
-
-@app.get("/api/travel/categories/{category_id}", response_model=TravelCategory, tags=["travel"])
-async def get_category_details(category_id: str):
-    """Get detailed information about a specific travel category."""
-    categories = {
-        "destinations": {
+# Static travel data, built once at import instead of on every request
+TRAVEL_MENU = {
+    "categories": [
+        {
             "id": "destinations",
             "name": "Popular Destinations",
             "description": "Explore some of the world's most iconic cities and breathtaking landscapes.",
             "items": [
                 {
                     "id": "paris",
-                    "name": "Paris, France",
-                    "description": "Known for the Eiffel Tower, Louvre Museum, and exquisite cuisine.",
-                    "price": "From $1,200 per person"
+                    "name": "Paris",
+                    "description": "The City of Light"
                 },
                 {
                     "id": "tokyo",
-                    "name": "Tokyo, Japan",
-                    "description": "A fascinating blend of ultramodern and traditional, from neon-lit skyscrapers to historic temples.",
-                    "price": "From $1,500 per person"
+                    "name": "Tokyo",
+                    "description": "Modern meets traditional"
                 },
                 {
                     "id": "nyc",
-                    "name": "New York City, USA",
-                    "description": "The city that never sleeps offers Broadway shows, world-class museums, and iconic landmarks.",
-                    "price": "From $1,100 per person"
-                },
-                {
-                    "id": "bali",
-                    "name": "Bali, Indonesia",
-                    "description": "Tropical paradise with beautiful beaches, lush rice terraces, and spiritual retreats.",
-                    "price": "From $950 per person"
+                    "name": "New York",
+                    "description": "The Big Apple"
                 }
             ]
         },
-        "activities": {
+        {
             "id": "activities",
             "name": "Activities",
             "description": "Enhance your travel experience with these unforgettable activities.",
             "items": [
                 {
                     "id": "tours",
-                    "name": "Guided City Tours",
-                    "description": "Explore with knowledgeable local guides who share insights and hidden gems.",
-                    "price": "From $25 per person"
+                    "name": "Guided Tours",
+                    "description": "Explore with local experts"
                 },
                 {
                     "id": "adventure",
                     "name": "Adventure Sports",
-                    "description": "From zip-lining and white water rafting to scuba diving and mountain climbing.",
-                    "price": "From $50 per activity"
+                    "description": "For thrill seekers"
                 },
                 {
                     "id": "culinary",
                     "name": "Culinary Experiences",
-                    "description": "Cooking classes, food tours, and wine tastings to savor local flavors.",
-                    "price": "From $40 per experience"
-                },
-                {
-                    "id": "cultural",
-                    "name": "Cultural Workshops",
-                    "description": "Learn traditional crafts, dance, or music from local artisans.",
-                    "price": "From $30 per workshop"
+                    "description": "Taste local flavors"
                 }
             ]
         },
-        "accommodations": {
+        {
             "id": "accommodations",
             "name": "Accommodations",
             "description": "Find the perfect place to stay for your travel style and budget.",
             "items": [
                 {
-                    "id": "luxury",
-                    "name": "Luxury Hotels",
-                    "description": "5-star accommodations with premium amenities and exceptional service.",
-                    "price": "From $250 per night"
-                },
-                {
-                    "id": "boutique",
-                    "name": "Boutique Hotels",
-                    "description": "Unique, stylish properties with personalized service and local character.",
-                    "price": "From $150 per night"
+                    "id": "hotels",
+                    "name": "Hotels",
+                    "description": "From budget to luxury"
                 },
                 {
                     "id": "rentals",
                     "name": "Vacation Rentals",
-                    "description": "Apartments, villas, and homes with kitchen facilities and more space.",
-                    "price": "From $100 per night"
+                    "description": "Homes away from home"
                 },
                 {
                     "id": "unique",
                     "name": "Unique Stays",
-                    "description": "Extraordinary accommodations like treehouses, igloos, underwater rooms, and more.",
-                    "price": "From $200 per night"
+                    "description": "Treehouses, igloos, and more"
                 }
             ]
         }
+    ]
+}
+
+TRAVEL_CATEGORIES = {
+    "destinations": {
+        "id": "destinations",
+        "name": "Popular Destinations",
+        "description": "Explore some of the world's most iconic cities and breathtaking landscapes.",
+        "items": [
+            {
+                "id": "paris",
+                "name": "Paris, France",
+                "description": "Known for the Eiffel Tower, Louvre Museum, and exquisite cuisine.",
+                "price": "From $1,200 per person"
+            },
+            {
+                "id": "tokyo",
+                "name": "Tokyo, Japan",
+                "description": "A fascinating blend of ultramodern and traditional, from neon-lit skyscrapers to historic temples.",
+                "price": "From $1,500 per person"
+            },
+            {
+                "id": "nyc",
+                "name": "New York City, USA",
+                "description": "The city that never sleeps offers Broadway shows, world-class museums, and iconic landmarks.",
+                "price": "From $1,100 per person"
+            },
+            {
+                "id": "bali",
+                "name": "Bali, Indonesia",
+                "description": "Tropical paradise with beautiful beaches, lush rice terraces, and spiritual retreats.",
+                "price": "From $950 per person"
+            }
+        ]
+    },
+    "activities": {
+        "id": "activities",
+        "name": "Activities",
+        "description": "Enhance your travel experience with these unforgettable activities.",
+        "items": [
+            {
+                "id": "tours",
+                "name": "Guided City Tours",
+                "description": "Explore with knowledgeable local guides who share insights and hidden gems.",
+                "price": "From $25 per person"
+            },
+            {
+                "id": "adventure",
+                "name": "Adventure Sports",
+                "description": "From zip-lining and white water rafting to scuba diving and mountain climbing.",
+                "price": "From $50 per activity"
+            },
+            {
+                "id": "culinary",
+                "name": "Culinary Experiences",
+                "description": "Cooking classes, food tours, and wine tastings to savor local flavors.",
+                "price": "From $40 per experience"
+            },
+            {
+                "id": "cultural",
+                "name": "Cultural Workshops",
+                "description": "Learn traditional crafts, dance, or music from local artisans.",
+                "price": "From $30 per workshop"
+            }
+        ]
+    },
+    "accommodations": {
+        "id": "accommodations",
+        "name": "Accommodations",
+        "description": "Find the perfect place to stay for your travel style and budget.",
+        "items": [
+            {
+                "id": "luxury",
+                "name": "Luxury Hotels",
+                "description": "5-star accommodations with premium amenities and exceptional service.",
+                "price": "From $250 per night"
+            },
+            {
+                "id": "boutique",
+                "name": "Boutique Hotels",
+                "description": "Unique, stylish properties with personalized service and local character.",
+                "price": "From $150 per night"
+            },
+            {
+                "id": "rentals",
+                "name": "Vacation Rentals",
+                "description": "Apartments, villas, and homes with kitchen facilities and more space.",
+                "price": "From $100 per night"
+            },
+            {
+                "id": "unique",
+                "name": "Unique Stays",
+                "description": "Extraordinary accommodations like treehouses, igloos, underwater rooms, and more.",
+                "price": "From $200 per night"
+            }
+        ]
     }
-    
-    if category_id not in categories:
+}
+
+# The travel data never changes, so encode it once; the travel endpoints
+# return these bytes as-is, skipping validation and JSON encoding per request.
+# Dumping through the models keeps defaults such as "price": null in the body
+TRAVEL_MENU_JSON = orjson.dumps(TravelMenu(**TRAVEL_MENU).model_dump())
+TRAVEL_CATEGORIES_JSON = {
+    category_id: orjson.dumps(TravelCategory(**category).model_dump())
+    for category_id, category in TRAVEL_CATEGORIES.items()
+}
+
+# Health probes hit this every few seconds; the body never changes
+HEALTHY_JSON = b'{"status":"healthy"}'
+
+# Default settings returned for every user
+DEFAULT_USER_SETTINGS = {
+    "Language": "English",
+    "Currency": "USD",
+    "Notifications": "Enabled",
+    "Time Format": "12-hour",
+    "Theme": "Light",
+    "Email": "user@example.com"
+}
+
+@app.get("/", response_model=RootResponse)
+async def root():
+    return {"message": "FastAPI Service v1.6 is running"}
+
+# Travel-related endpoints
+@app.get("/api/travel/menu", responses={200: {"model": TravelMenu}}, tags=["travel"])
+async def get_travel_menu():
+    """Get the travel menu with all categories and items."""
+    return Response(content=TRAVEL_MENU_JSON, media_type="application/json")
+
+@app.get("/api/travel/categories/{category_id}", responses={200: {"model": TravelCategory}}, tags=["travel"])
+async def get_category_details(category_id: str):
+    """Get detailed information about a specific travel category."""
+    category_json = TRAVEL_CATEGORIES_JSON.get(category_id)
+    if category_json is None:
         raise HTTPException(status_code=404, detail=f"Category {category_id} not found")
     
-    return categories[category_id]
+    return Response(content=category_json, media_type="application/json")
 
 @app.get("/api/users/{user_id}/settings", response_model=UserSettings, tags=["users"])
 async def get_user_settings(user_id: str):
@@ -232,14 +304,7 @@ async def get_user_settings(user_id: str):
     # In a real application, this would fetch from a database
     return {
         "user_id": user_id,
-        "settings": {
-            "Language": "English",
-            "Currency": "USD",
-            "Notifications": "Enabled",
-            "Time Format": "12-hour",
-            "Theme": "Light",
-            "Email": "user@example.com"
-        }
+        "settings": DEFAULT_USER_SETTINGS
     }
 
 # Include test endpoints only in local development environment
@@ -251,37 +316,76 @@ if IS_LOCAL_DEV:
         app.include_router(test_router)
         logger.info("Test endpoints included for local development")
     except ImportError as e:
-        logger.warning(f"Test endpoints not found: {str(e)}")
+        logger.warning("Test endpoints not found: %s", e)
         logger.info("Using main application endpoints instead")
 
-@app.post("/process")
+async def send_batch_to_broker(client: httpx.AsyncClient, batch: List[Dict[str, str]]):
+    """Send a batch of processed messages to the message broker."""
+    body = orjson.dumps({"messages": batch})
+    delay = BROKER_RETRY_BACKOFF
+    for attempt in range(1, BROKER_SEND_ATTEMPTS + 1):
+        try:
+            response = await client.post("/send_batch", content=body, headers=JSON_HEADERS)
+            if response.status_code == 200:
+                return
+            if response.status_code < 500:
+                # The broker rejected the batch itself; retrying won't help
+                break
+            logger.warning(
+                "Broker returned %s for %s messages (attempt %s/%s)",
+                response.status_code, len(batch), attempt, BROKER_SEND_ATTEMPTS
+            )
+        except httpx.TransportError as e:
+            logger.warning(
+                "Error sending %s messages to broker (attempt %s/%s): %s",
+                len(batch), attempt, BROKER_SEND_ATTEMPTS, e
+            )
+        except Exception as e:
+            logger.error("Error sending %s messages to broker: %s", len(batch), e)
+            break
+        if attempt < BROKER_SEND_ATTEMPTS:
+            await asyncio.sleep(delay)
+            delay *= 2
+    logger.error("Dropped %s messages that could not be sent to the broker", len(batch))
+
+async def broker_flusher(client: httpx.AsyncClient):
+    """Drain the broker queue, sending queued messages in batches."""
+    while True:
+        batch = [await broker_queue.get()]
+        while len(batch) < BROKER_BATCH_SIZE and not broker_queue.empty():
+            batch.append(broker_queue.get_nowait())
+        await send_batch_to_broker(client, batch)
+        for _ in batch:
+            broker_queue.task_done()
+
+@app.post("/process", response_model=ProcessResponse)
 async def process_message(message: Message):
     try:
-        logger.info(f"Processing message: {message.content}")
+        logger.info("Processing message: %s", message.content)
         
         # Process the message (add your logic here)
         processed_content = f"Processed: {message.content}"
         
-        # Send the processed message to the Telegram bot via message broker
+        # Queue the processed message for the Telegram bot; the broker flusher
+        # sends it so the caller doesn't wait on the broker
         if message.user_id:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{BROKER_URL}/send",
-                    json={
-                        "user_id": message.user_id,
-                        "content": processed_content,
-                        "service": "fastapi"
-                    }
-                )
-                if response.status_code != 200:
-                    logger.error(f"Failed to send message to broker: {response.text}")
-                    raise HTTPException(status_code=500, detail="Failed to send message to broker")
+            try:
+                broker_queue.put_nowait({
+                    "user_id": message.user_id,
+                    "content": processed_content,
+                    "service": "fastapi"
+                })
+            except asyncio.QueueFull:
+                logger.warning("Broker queue full, rejecting message")
+                raise HTTPException(status_code=503, detail="Message broker is busy")
         
         return {"processed": processed_content}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
+        logger.error("Error processing message: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return Response(content=HEALTHY_JSON, media_type="application/json")
\ No newline at end of file
@@ -3,9 +3,10 @@ Test endpoints for local development.
 These endpoints are only available in the local development environment.
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 import httpx
+import asyncio
 import os
 import logging
 from typing import Dict, Any, List, Optional
@@ -50,78 +51,85 @@ async def test_root():
         }
     }
 
-@router.get("/health", response_model=List[ServiceStatus])
-async def test_health():
-    """Test endpoint to check the health of all services."""
-    services = []
-    
-    # Check FastAPI app
-    services.append({
-        "service": "fastapi-app",
-        "status": "up",
-        "details": {"message": "FastAPI app is running"}
-    })
-    
-    # Check Message Broker
+async def probe_broker(client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Check the message broker's root endpoint."""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{BROKER_URL}")
-            if response.status_code == 200:
-                services.append({
-                    "service": "message-broker",
-                    "status": "up",
-                    "details": response.json()
-                })
-            else:
-                services.append({
-                    "service": "message-broker",
-                    "status": "error",
-                    "details": {"error": f"Status code: {response.status_code}"}
-                })
+        response = await client.get(f"{BROKER_URL}", timeout=5.0)
+        if response.status_code == 200:
+            return {
+                "service": "message-broker",
+                "status": "up",
+                "details": response.json()
+            }
+        return {
+            "service": "message-broker",
+            "status": "error",
+            "details": {"error": f"Status code: {response.status_code}"}
+        }
     except Exception as e:
-        services.append({
+        return {
             "service": "message-broker",
             "status": "down",
             "details": {"error": str(e)}
-        })
-    
-    # Check Telegram Bot
+        }
+
+async def probe_telegram_bot(client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Check that the Telegram bot is reachable."""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get("http://telegram-bot:8080")
-            services.append({
-                "service": "telegram-bot",
-                "status": "up" if response.status_code != 500 else "error",
-                "details": {"status_code": response.status_code}
-            })
+        response = await client.get("http://telegram-bot:8080", timeout=5.0)
+        return {
+            "service": "telegram-bot",
+            "status": "up" if response.status_code != 500 else "error",
+            "details": {"status_code": response.status_code}
+        }
     except Exception as e:
-        services.append({
+        return {
             "service": "telegram-bot",
             "status": "down",
             "details": {"error": str(e)}
-        })
+        }
+
+@router.get("/health", response_model=List[ServiceStatus])
+async def test_health(request: Request):
+    """Test endpoint to check the health of all services."""
+    client = request.app.state.http
+    
+    # Probe the other services concurrently so one slow service
+    # costs a single timeout rather than one per probe
+    broker_status, bot_status = await asyncio.gather(
+        probe_broker(client),
+        probe_telegram_bot(client)
+    )
     
-    return services
+    return [
+        {
+            "service": "fastapi-app",
+            "status": "up",
+            "details": {"message": "FastAPI app is running"}
+        },
+        broker_status,
+        bot_status
+    ]
 
 @router.post("/send-message", response_model=TestResponse)
-async def test_send_message(message: TestMessage):
+async def test_send_message(message: TestMessage, request: Request):
     """Test endpoint to send a message through the system."""
     try:
         # Send message to the broker
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.post(
-                f"{BROKER_URL}/send",
-                json={"content": message.content, "user_id": message.user_id, "service": "test"}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail="Failed to send message to broker")
-            
-            return {
-                "success": True,
-                "message": f"Message sent successfully: {message.content}",
-                "data": response.json()
-            }
+        response = await request.app.state.http.post(
+            f"{BROKER_URL}/send",
+            json={"content": message.content, "user_id": message.user_id, "service": "test"},
+            timeout=5.0
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail="Failed to send message to broker")
+        
+        return {
+            "success": True,
+            "message": f"Message sent successfully: {message.content}",
+            "data": response.json()
+        }
     except httpx.RequestError as e:
         logger.error(f"Error sending message to broker: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error sending message to broker: {str(e)}")
@@ -1,6 +1,9 @@
 from fastapi.testclient import TestClient
 import pytest
-from app.main import app
+import asyncio
+import httpx
+from unittest.mock import patch, AsyncMock, Mock
+from app.main import app, broker_queue, send_batch_to_broker
 
 client = TestClient(app)
 
@@ -15,4 +18,45 @@ def test_health_check():
     assert response.status_code == 200
     assert response.json() == {"status": "healthy"}
 
+def test_process_queues_message_for_broker():
+    response = client.post("/process", json={"content": "hello", "user_id": "123"})
+    assert response.status_code == 200
+    assert response.json() == {"processed": "Processed: hello"}
+    assert broker_queue.get_nowait() == {
+        "user_id": "123",
+        "content": "Processed: hello",
+        "service": "fastapi"
+    }
+    broker_queue.task_done()
+
+def test_process_rejects_when_broker_queue_full():
+    full_queue = asyncio.Queue(maxsize=1)
+    full_queue.put_nowait({})
+    with patch("app.main.broker_queue", full_queue):
+        response = client.post("/process", json={"content": "hello", "user_id": "123"})
+    assert response.status_code == 503
+
+def test_travel_category_details():
+    response = client.get("/api/travel/categories/destinations")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["id"] == "destinations"
+    assert client.get("/api/travel/categories/unknown").status_code == 404
+
+def test_travel_menu_includes_unset_prices():
+    response = client.get("/api/travel/menu")
+    assert response.status_code == 200
+    assert response.json()["categories"][0]["items"][0]["price"] is None
+
+async def test_send_batch_retries_broker_errors():
+    broker = Mock()
+    broker.post = AsyncMock(side_effect=[
+        httpx.ConnectError("connection refused"),
+        Mock(status_code=503, text="starting"),
+        Mock(status_code=200)
+    ])
+    with patch("app.main.BROKER_RETRY_BACKOFF", 0):
+        await send_batch_to_broker(broker, [{"user_id": "123", "content": "hello", "service": "fastapi"}])
+    assert broker.post.await_count == 3
+
 # Add more tests as needed 
\ No newline at end of file
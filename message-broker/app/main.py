@@ -1,100 +1,261 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 import os
 import logging
 from pydantic import BaseModel
-import httpx
-from typing import Optional
-from google.cloud import pubsub_v1
-import json
+import aiohttp
+from typing import Optional, List
+from contextlib import asynccontextmanager
+from concurrent import futures
+import asyncio
+import threading
+import time
+import msgpack
+import orjson
 import uuid
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Message Broker Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared session so connections to the Telegram bot are kept alive
+    app.state.session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=200, keepalive_timeout=60),
+        timeout=aiohttp.ClientTimeout(total=5)
+    )
+    # Build the Pub/Sub client in the background so the port opens right away
+    warmup = asyncio.create_task(warm_publisher())
+    yield
+    try:
+        await warmup
+        # Publish anything still sitting in a batch before the process exits;
+        # there is nothing to flush if the publisher was never built
+        if publisher is not None:
+            await asyncio.get_running_loop().run_in_executor(pubsub_executor, flush_publishes)
+    finally:
+        pubsub_executor.shutdown(wait=False)
+        await app.state.session.close()
+
+app = FastAPI(title="Message Broker Service", lifespan=lifespan)
 
 # GCP Pub/Sub configuration
 PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 TOPIC_ID = os.getenv("GCP_PUBSUB_TOPIC_ID", "messages")
 
+# Check if we're in a local development environment
+IS_LOCAL_DEV = os.getenv("ENVIRONMENT", "production").lower() == "development"
+
+# Content type attribute attached to every published message
+CONTENT_TYPE = "msgpack"
+
 # Telegram bot service URL
 TELEGRAM_BOT_URL = os.getenv("TELEGRAM_BOT_URL", "http://localhost:8080")
+TELEGRAM_SEND_URL = f"{TELEGRAM_BOT_URL}/send"
+
+# The root endpoint doubles as a liveness ping; its body never changes
+ROOT_JSON = b'{"message":"Message Broker Service is running"}'
+
+# Content type for the orjson-encoded forwards to the Telegram bot
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+topic_path = f"projects/{PROJECT_ID}/topics/{TOPIC_ID}"
+
+# Pub/Sub health check results are reused so repeated liveness and
+# readiness probes don't each reach Pub/Sub; failures expire sooner so
+# recovery is noticed quickly
+HEALTH_TTL_SUCCESS = 27.0
+HEALTH_TTL_FAILURE = 9.0
+health_cache = {"expires": float("-inf"), "error": None}
+health_lock = asyncio.Lock()
+
+# Dedicated pool for blocking Pub/Sub calls made from async handlers
+pubsub_executor = futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="pubsub")
+
+# Created on first use; the lock stops a request that arrives during the
+# startup warm-up from building a second client. Only executor threads call
+# get_publisher, so the event loop never waits on the lock
+publisher = None
+publisher_lock = threading.Lock()
+
+def get_publisher():
+    """Return the Pub/Sub publisher, creating it on first use."""
+    global publisher
+    if publisher is None:
+        with publisher_lock:
+            if publisher is None:
+                publisher = create_publisher()
+    return publisher
+
+async def resolve_publisher():
+    """Return the Pub/Sub publisher, creating it off the event loop if needed."""
+    if publisher is not None:
+        return publisher
+    return await asyncio.get_running_loop().run_in_executor(pubsub_executor, get_publisher)
+
+async def warm_publisher():
+    """Create the Pub/Sub publisher off the event loop."""
+    try:
+        await resolve_publisher()
+    except Exception as e:
+        # get_publisher tries again on the next request
+        logger.error("Failed to create Pub/Sub publisher: %s", e)
+
+def create_publisher():
+    """Create the Pub/Sub publisher."""
+    # google.cloud.pubsub_v1 pulls in hundreds of protobuf modules, so it is
+    # imported here rather than when the module loads
+    from google.cloud import pubsub_v1
+    
+    # Batch publishes so concurrent requests share a single Pub/Sub RPC
+    batch_settings = pubsub_v1.types.BatchSettings(
+        max_messages=100,
+        max_bytes=1024 * 1024,
+        max_latency=0.01,
+    )
+    client = pubsub_v1.PublisherClient(batch_settings=batch_settings)
+    
+    # Check if the topic exists, if not create it. Only done in local
+    # development; in production the topic is provisioned by setup-pubsub.sh
+    if IS_LOCAL_DEV:
+        try:
+            client.get_topic(request={"topic": topic_path})
+            logger.info("Topic %s already exists", topic_path)
+        except Exception as e:
+            try:
+                client.create_topic(request={"name": topic_path})
+                logger.info("Topic %s created successfully", topic_path)
+            except Exception as e:
+                logger.error("Failed to create topic: %s", e)
+    
+    return client
 
-# Initialize Pub/Sub publisher
-publisher = pubsub_v1.PublisherClient()
-topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
+# Publish futures that have not completed yet
+pending_publishes = set()
 
-# Check if the topic exists, if not create it
-try:
-    publisher.get_topic(request={"topic": topic_path})
-    logger.info(f"Topic {topic_path} already exists")
-except Exception as e:
+def _on_publish_done(future):
+    """Log the outcome of a publish once its batch has been sent."""
+    pending_publishes.discard(future)
     try:
-        publisher.create_topic(request={"name": topic_path})
-        logger.info(f"Topic {topic_path} created successfully")
+        logger.info("Message published to Pub/Sub with ID: %s", future.result())
     except Exception as e:
-        logger.error(f"Failed to create topic: {str(e)}")
+        logger.error("Failed to publish message to Pub/Sub: %s", e)
+
+def flush_publishes(timeout: float = 10.0):
+    """Send all batched messages and wait for outstanding publishes."""
+    get_publisher().stop()
+    futures.wait(pending_publishes.copy(), timeout=timeout)
 
 class Message(BaseModel):
     user_id: str
     content: str
     service: Optional[str] = None
 
+class SendResponse(BaseModel):
+    status: str
+    message_id: Optional[str] = None
+    detail: Optional[str] = None
+
+class MessageBatch(BaseModel):
+    messages: List[Message]
+
+class SendBatchResponse(BaseModel):
+    status: str
+    message_ids: List[str]
+
+class HealthResponse(BaseModel):
+    status: str
+
+def publish_message(publisher, message: Message) -> str:
+    """Queue a message for publishing to Pub/Sub and return its ID."""
+    # Create a unique message ID
+    message_id = str(uuid.uuid4())
+    
+    # Prepare message data
+    message_data = {
+        "id": message_id,
+        "user_id": message.user_id,
+        "content": message.content,
+        "service": message.service or "unknown"
+    }
+    
+    # Publish message to Pub/Sub as MessagePack; the "ct" attribute
+    # tells the subscriber which decoder to use
+    data = msgpack.packb(message_data)
+    # Don't block on the result; the batch is sent in the background
+    future = publisher.publish(topic_path, data, ct=CONTENT_TYPE)
+    pending_publishes.add(future)
+    future.add_done_callback(_on_publish_done)
+    
+    return message_id
+
 @app.get("/")
 async def root():
-    return {"message": "Message Broker Service is running"}
+    return Response(content=ROOT_JSON, media_type="application/json")
 
-@app.post("/send")
-async def send_message(message: Message):
+@app.post("/send", response_model=SendResponse, response_model_exclude_none=True)
+async def send_message(message: Message, request: Request):
     try:
-        # Create a unique message ID
-        message_id = str(uuid.uuid4())
-        
-        # Prepare message data
-        message_data = {
-            "id": message_id,
-            "user_id": message.user_id,
-            "content": message.content,
-            "service": message.service or "unknown"
-        }
-        
-        # Publish message to Pub/Sub
-        data = json.dumps(message_data).encode("utf-8")
-        future = publisher.publish(topic_path, data)
-        pub_id = future.result()
-        
-        logger.info(f"Message published to Pub/Sub with ID: {pub_id}")
+        message_id = publish_message(await resolve_publisher(), message)
         
         # Only forward to Telegram bot if the message didn't originate from FastAPI
         # This prevents duplicate messages during the request chain
         if message.service != "fastapi":
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{TELEGRAM_BOT_URL}/send",
-                    json={
-                        "user_id": message.user_id,
-                        "content": message.content
-                    }
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Error forwarding to Telegram bot: {response.text}")
+            async with request.app.state.session.post(
+                TELEGRAM_SEND_URL,
+                data=orjson.dumps({
+                    "user_id": message.user_id,
+                    "content": message.content
+                }),
+                headers=JSON_HEADERS
+            ) as response:
+                if response.status != 200:
+                    logger.error("Error forwarding to Telegram bot: %s", await response.text())
                     return {"status": "queued", "detail": "Failed to forward to Telegram bot"}
         else:
-            logger.info(f"Skipping direct forward to Telegram bot for message from FastAPI")
+            logger.info("Skipping direct forward to Telegram bot for message from FastAPI")
         
         return {"status": "sent", "message_id": message_id}
     except Exception as e:
-        logger.error(f"Error sending message: {str(e)}")
+        logger.error("Error sending message: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/health")
-async def health_check():
+@app.post("/send_batch", response_model=SendBatchResponse)
+async def send_message_batch(batch: MessageBatch):
+    """Publish several messages in one request."""
     try:
-        # Check Pub/Sub connection by listing topics
-        publisher.list_topics(request={"project": f"projects/{PROJECT_ID}"})
-        return {"status": "healthy"}
+        # Unlike /send there is no direct forward; the subscriber delivers these
+        publisher = await resolve_publisher()
+        message_ids = [publish_message(publisher, message) for message in batch.messages]
+        return {"status": "sent", "message_ids": message_ids}
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        raise HTTPException(status_code=503, detail=str(e))
\ No newline at end of file
+        logger.error("Error sending message batch: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def list_topics():
+    """List the project's topics, creating the publisher first if needed."""
+    return get_publisher().list_topics(request={"project": f"projects/{PROJECT_ID}"})
+
+async def check_pubsub() -> Optional[str]:
+    """Return None if Pub/Sub is reachable, otherwise the error, caching the result."""
+    # Probes that arrive while a check is running wait for its result
+    async with health_lock:
+        if time.monotonic() < health_cache["expires"]:
+            return health_cache["error"]
+        try:
+            # Check Pub/Sub connection by listing topics, off the event loop
+            await asyncio.get_running_loop().run_in_executor(pubsub_executor, list_topics)
+            error, ttl = None, HEALTH_TTL_SUCCESS
+        except Exception as e:
+            logger.error("Health check failed: %s", e)
+            error, ttl = str(e), HEALTH_TTL_FAILURE
+        health_cache["error"] = error
+        health_cache["expires"] = time.monotonic() + ttl
+        return error
+
+@app.get("/health", response_model=HealthResponse)
+async def health_check():
+    error = await check_pubsub()
+    if error is not None:
+        raise HTTPException(status_code=503, detail=error)
+    return {"status": "healthy"}
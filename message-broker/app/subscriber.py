@@ -1,10 +1,13 @@
 import os
-import json
 import logging
 from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
 import httpx
+import msgpack
+import orjson
 import time
-from concurrent.futures import TimeoutError
+import random
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,59 +18,98 @@ PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 SUBSCRIPTION_ID = os.getenv("GCP_PUBSUB_SUBSCRIPTION_ID", "messages-sub")
 TOPIC_ID = os.getenv("GCP_PUBSUB_TOPIC_ID", "messages")
 
+# Check if we're in a local development environment
+IS_LOCAL_DEV = os.getenv("ENVIRONMENT", "production").lower() == "development"
+
 # Telegram bot service URL
 TELEGRAM_BOT_URL = os.getenv("TELEGRAM_BOT_URL", "http://localhost:8080")
+TELEGRAM_SEND_URL = f"{TELEGRAM_BOT_URL}/send"
+
+# Limit outstanding messages held by the client at any time
+FLOW_CONTROL = pubsub_v1.types.FlowControl(
+    max_messages=1000,
+    max_bytes=100 * 1024 * 1024,
+)
+
+# Callbacks block on HTTP to the Telegram bot, so size the pool for I/O
+CALLBACK_WORKERS = (os.cpu_count() or 1) * 4
+
+# Delay before restarting the subscriber after an error, doubled on each
+# consecutive failure up to the maximum. A stream that stayed up for at least
+# RESTART_BACKOFF_RESET seconds before failing starts again from the initial delay
+RESTART_BACKOFF_INITIAL = 1.0
+RESTART_BACKOFF_MAX = 60.0
+RESTART_BACKOFF_RESET = 300.0
+
+# Content type for the orjson-encoded /send requests
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Shared HTTP client reused by all callback threads
+http_client = httpx.Client(
+    timeout=10.0,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+)
 
 # Initialize Pub/Sub subscriber
 subscriber = pubsub_v1.SubscriberClient()
 subscription_path = subscriber.subscription_path(PROJECT_ID, SUBSCRIPTION_ID)
 topic_path = subscriber.topic_path(PROJECT_ID, TOPIC_ID)
 
-# Check if the subscription exists, if not create it
-try:
-    subscriber.get_subscription(request={"subscription": subscription_path})
-    logger.info(f"Subscription {subscription_path} already exists")
-except Exception as e:
+# Check if the subscription exists, if not create it. Only done in local
+# development; in production the subscription is provisioned by setup-pubsub.sh
+if IS_LOCAL_DEV:
     try:
-        subscriber.create_subscription(
-            request={"name": subscription_path, "topic": topic_path}
-        )
-        logger.info(f"Subscription {subscription_path} created successfully")
+        subscriber.get_subscription(request={"subscription": subscription_path})
+        logger.info("Subscription %s already exists", subscription_path)
     except Exception as e:
-        logger.error(f"Failed to create subscription: {str(e)}")
+        try:
+            subscriber.create_subscription(
+                request={"name": subscription_path, "topic": topic_path}
+            )
+            logger.info("Subscription %s created successfully", subscription_path)
+        except Exception as e:
+            logger.error("Failed to create subscription: %s", e)
 
 def process_message(message):
     """Process a message received from Pub/Sub."""
     try:
-        data = json.loads(message.data.decode("utf-8"))
-        logger.info(f"Received message: {data}")
+        # Messages published by the broker are MessagePack; fall back to JSON
+        # for anything published without a content type attribute
+        if message.attributes.get("ct") == "msgpack":
+            data = msgpack.unpackb(message.data)
+        else:
+            data = orjson.loads(message.data)
+        logger.debug("Received message: %s", data)
         
-        # Forward the message to the Telegram bot
+        # Forward the message to the Telegram bot. Connection errors fall
+        # through to the handler below and nack the message for redelivery.
         if "user_id" in data and "content" in data:
-            try:
-                # Use httpx to send the message to the Telegram bot
-                with httpx.Client(timeout=10.0) as client:
-                    response = client.post(
-                        f"{TELEGRAM_BOT_URL}/send",
-                        json={
-                            "user_id": data["user_id"],
-                            "content": data["content"]
-                        }
-                    )
-                    
-                    if response.status_code == 200:
-                        logger.info(f"Message forwarded to Telegram bot successfully")
-                    else:
-                        logger.error(f"Failed to forward message to Telegram bot: {response.text}")
-            except Exception as e:
-                logger.error(f"Error forwarding message to Telegram bot: {str(e)}")
+            response = http_client.post(
+                TELEGRAM_SEND_URL,
+                content=orjson.dumps({
+                    "user_id": data["user_id"],
+                    "content": data["content"]
+                }),
+                headers=JSON_HEADERS
+            )
+            
+            if response.status_code == 200:
+                logger.info("Message forwarded to Telegram bot successfully")
+            elif response.status_code >= 500:
+                # Only ack once delivered; let Pub/Sub redeliver on server errors
+                logger.error("Failed to forward message to Telegram bot, will retry: %s", response.text)
+                message.nack()
+                return False
+            else:
+                # 4xx means Telegram refused the message; redelivery can't fix it
+                logger.error("Telegram bot rejected message, not retrying: %s", response.text)
         
         # Acknowledge the message
         message.ack()
         
         return True
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
+        logger.error("Error processing message: %s", e)
         # Negative acknowledgement - message will be redelivered
         message.nack()
         return False
@@ -76,25 +118,40 @@ def start_subscriber():
     """Start the subscriber to listen for messages."""
     logger.info("Starting Pub/Sub subscriber...")
     
-    streaming_pull_future = subscriber.subscribe(
-        subscription_path, callback=process_message
-    )
-    
-    # Keep the subscriber running
-    try:
-        logger.info(f"Listening for messages on {subscription_path}")
-        # Result() blocks until an exception is raised
-        streaming_pull_future.result()
-    except TimeoutError:
-        streaming_pull_future.cancel()
-        logger.warning("Streaming pull future timed out, restarting...")
-        start_subscriber()
-    except Exception as e:
-        streaming_pull_future.cancel()
-        logger.error(f"Subscriber error: {str(e)}")
-        # Wait a bit before restarting
-        time.sleep(5)
-        start_subscriber()
+    delay = RESTART_BACKOFF_INITIAL
+    while True:
+        # A fresh scheduler is needed per subscribe; it is shut down on cancel
+        scheduler = ThreadScheduler(
+            executor=ThreadPoolExecutor(max_workers=CALLBACK_WORKERS)
+        )
+        streaming_pull_future = subscriber.subscribe(
+            subscription_path,
+            callback=process_message,
+            flow_control=FLOW_CONTROL,
+            scheduler=scheduler,
+            await_callbacks_on_shutdown=True
+        )
+        
+        started = time.monotonic()
+        
+        # Keep the subscriber running
+        try:
+            logger.info("Listening for messages on %s", subscription_path)
+            # Result() blocks until an exception is raised
+            streaming_pull_future.result()
+        except TimeoutError:
+            streaming_pull_future.cancel()
+            logger.warning("Streaming pull future timed out, restarting...")
+            delay = RESTART_BACKOFF_INITIAL
+        except Exception as e:
+            streaming_pull_future.cancel()
+            logger.error("Subscriber error: %s", e)
+            if time.monotonic() - started >= RESTART_BACKOFF_RESET:
+                delay = RESTART_BACKOFF_INITIAL
+            # Back off exponentially, with jitter so restarting instances
+            # don't reconnect in lockstep
+            time.sleep(delay + random.random())
+            delay = min(delay * 2, RESTART_BACKOFF_MAX)
 
 if __name__ == "__main__":
     start_subscriber() 
\ No newline at end of file
@@ -19,16 +19,61 @@ client = TestClient(app)
 
 def test_health_check():
     """Test that the health check endpoint returns a healthy status."""
-    # Mock the publisher.list_topics method to avoid actual API calls
-    with unittest.mock.patch('app.main.publisher.list_topics'):
+    # Mock the publisher so list_topics makes no actual API calls
+    with unittest.mock.patch('app.main.get_publisher'):
         response = client.get("/health")
         assert response.status_code == 200
         assert "status" in response.json()
         assert response.json()["status"] == "healthy"
 
+def test_health_check_reuses_recent_result():
+    """Test that back-to-back health checks only reach Pub/Sub once."""
+    with unittest.mock.patch.dict('app.main.health_cache', {"expires": float("-inf"), "error": None}), \
+            unittest.mock.patch('app.main.get_publisher') as mock_get_publisher:
+        assert client.get("/health").status_code == 200
+        assert client.get("/health").status_code == 200
+        assert mock_get_publisher.return_value.list_topics.call_count == 1
+
+def test_health_check_caches_failures():
+    """Test that a failed Pub/Sub check keeps returning 503 without retrying."""
+    with unittest.mock.patch.dict('app.main.health_cache', {"expires": float("-inf"), "error": None}), \
+            unittest.mock.patch('app.main.get_publisher') as mock_get_publisher:
+        mock_get_publisher.return_value.list_topics.side_effect = RuntimeError("unavailable")
+        assert client.get("/health").status_code == 503
+        assert client.get("/health").status_code == 503
+        assert mock_get_publisher.return_value.list_topics.call_count == 1
+
 def test_root_endpoint():
     """Test that the root endpoint returns a message."""
     response = client.get("/")
     assert response.status_code == 200
     assert "message" in response.json()
-    assert "Message Broker Service is running" in response.json()["message"] 
\ No newline at end of file
+    assert "Message Broker Service is running" in response.json()["message"] 
+
+def test_send_message_does_not_wait_for_publish():
+    """Test that /send publishes without blocking on the Pub/Sub result."""
+    with unittest.mock.patch('app.main.get_publisher') as mock_get_publisher:
+        mock_publish = mock_get_publisher.return_value.publish
+        response = client.post("/send", json={
+            "user_id": "123",
+            "content": "hello",
+            "service": "fastapi"
+        })
+        assert response.status_code == 200
+        assert response.json()["status"] == "sent"
+        assert mock_publish.call_args.kwargs["ct"] == "msgpack"
+        mock_publish.return_value.result.assert_not_called()
+        mock_publish.return_value.add_done_callback.assert_called_once()
+
+def test_send_message_batch_publishes_each_message():
+    """Test that /send_batch publishes every message in the batch."""
+    with unittest.mock.patch('app.main.get_publisher') as mock_get_publisher:
+        mock_publish = mock_get_publisher.return_value.publish
+        response = client.post("/send_batch", json={"messages": [
+            {"user_id": "1", "content": "a", "service": "fastapi"},
+            {"user_id": "2", "content": "b", "service": "fastapi"}
+        ]})
+        assert response.status_code == 200
+        assert response.json()["status"] == "sent"
+        assert len(response.json()["message_ids"]) == 2
+        assert mock_publish.call_count == 2
@@ -14,6 +14,12 @@ fi
 GCP_PROJECT_ID=${GCP_PROJECT_ID:-""}
 GCP_PUBSUB_TOPIC_ID=${GCP_PUBSUB_TOPIC_ID:-"messages"}
 GCP_PUBSUB_SUBSCRIPTION_ID=${GCP_PUBSUB_SUBSCRIPTION_ID:-"messages-sub"}
+GCP_PUBSUB_DEAD_LETTER_TOPIC_ID=${GCP_PUBSUB_DEAD_LETTER_TOPIC_ID:-"$GCP_PUBSUB_TOPIC_ID-dead-letter"}
+# Nacked messages are redelivered with backoff and moved to the dead-letter
+# topic after this many attempts instead of being retried forever
+MAX_DELIVERY_ATTEMPTS=${MAX_DELIVERY_ATTEMPTS:-10}
+MIN_RETRY_DELAY=${MIN_RETRY_DELAY:-"10s"}
+MAX_RETRY_DELAY=${MAX_RETRY_DELAY:-"600s"}
 
 # Check if project ID is provided
 if [ -z "$GCP_PROJECT_ID" ]; then
@@ -26,6 +32,7 @@ echo "Using the following configuration:"
 echo "  Project ID: $GCP_PROJECT_ID"
 echo "  Topic ID: $GCP_PUBSUB_TOPIC_ID"
 echo "  Subscription ID: $GCP_PUBSUB_SUBSCRIPTION_ID"
+echo "  Dead-letter topic ID: $GCP_PUBSUB_DEAD_LETTER_TOPIC_ID"
 
 # Check if user is authenticated with gcloud
 if ! gcloud auth print-identity-token &> /dev/null; then
@@ -55,16 +62,48 @@ else
     echo "Topic $GCP_PUBSUB_TOPIC_ID already exists."
 fi
 
-# Create subscription if it doesn't exist
+# Create dead-letter topic if it doesn't exist
+if ! gcloud pubsub topics describe $GCP_PUBSUB_DEAD_LETTER_TOPIC_ID &> /dev/null; then
+    echo "Creating Pub/Sub dead-letter topic $GCP_PUBSUB_DEAD_LETTER_TOPIC_ID..."
+    gcloud pubsub topics create $GCP_PUBSUB_DEAD_LETTER_TOPIC_ID
+    echo "Dead-letter topic created successfully."
+else
+    echo "Dead-letter topic $GCP_PUBSUB_DEAD_LETTER_TOPIC_ID already exists."
+fi
+
+# Create subscription if it doesn't exist, otherwise bring its retry and
+# dead-letter policy up to date
 if ! gcloud pubsub subscriptions describe $GCP_PUBSUB_SUBSCRIPTION_ID &> /dev/null; then
     echo "Creating Pub/Sub subscription $GCP_PUBSUB_SUBSCRIPTION_ID..."
     gcloud pubsub subscriptions create $GCP_PUBSUB_SUBSCRIPTION_ID \
         --topic=$GCP_PUBSUB_TOPIC_ID \
-        --ack-deadline=60
+        --ack-deadline=60 \
+        --min-retry-delay=$MIN_RETRY_DELAY \
+        --max-retry-delay=$MAX_RETRY_DELAY \
+        --dead-letter-topic=$GCP_PUBSUB_DEAD_LETTER_TOPIC_ID \
+        --max-delivery-attempts=$MAX_DELIVERY_ATTEMPTS
     echo "Subscription created successfully."
 else
-    echo "Subscription $GCP_PUBSUB_SUBSCRIPTION_ID already exists."
+    echo "Subscription $GCP_PUBSUB_SUBSCRIPTION_ID already exists, updating retry policy..."
+    gcloud pubsub subscriptions update $GCP_PUBSUB_SUBSCRIPTION_ID \
+        --min-retry-delay=$MIN_RETRY_DELAY \
+        --max-retry-delay=$MAX_RETRY_DELAY \
+        --dead-letter-topic=$GCP_PUBSUB_DEAD_LETTER_TOPIC_ID \
+        --max-delivery-attempts=$MAX_DELIVERY_ATTEMPTS
+    echo "Subscription updated successfully."
 fi
 
+# The Pub/Sub service agent forwards undeliverable messages, so it needs to
+# publish to the dead-letter topic and acknowledge on the subscription
+PROJECT_NUMBER=$(gcloud projects describe $GCP_PROJECT_ID --format="value(projectNumber)")
+PUBSUB_SERVICE_AGENT="serviceAccount:service-$PROJECT_NUMBER@gcp-sa-pubsub.iam.gserviceaccount.com"
+echo "Granting dead-letter permissions to $PUBSUB_SERVICE_AGENT..."
+gcloud pubsub topics add-iam-policy-binding $GCP_PUBSUB_DEAD_LETTER_TOPIC_ID \
+    --member=$PUBSUB_SERVICE_AGENT \
+    --role=roles/pubsub.publisher > /dev/null
+gcloud pubsub subscriptions add-iam-policy-binding $GCP_PUBSUB_SUBSCRIPTION_ID \
+    --member=$PUBSUB_SERVICE_AGENT \
+    --role=roles/pubsub.subscriber > /dev/null
+
 echo "Pub/Sub setup completed successfully."
 echo "You can now use the message broker service with Google Cloud Pub/Sub." 
\ No newline at end of file
@@ -1,31 +1,112 @@
 import os
 import logging
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Response
 from pydantic import BaseModel
 import httpx
 from typing import Optional, Dict, Any, List, Union
-import json
+from contextlib import asynccontextmanager
+import orjson
 import asyncio
+import time
+from collections import OrderedDict
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def configure_logging():
+    """Configure logging at startup rather than as an import side effect"""
+    # basicConfig is a no-op if the root logger already has handlers
+    logging.basicConfig(level=logging.INFO)
+
 # Environment variables
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable is not set")
 
+# Connection pool limits for the shared HTTP clients. Requests beyond
+# max_connections wait for a free connection instead of opening new sockets
+HTTPX_MAX_CONNECTIONS = int(os.getenv("HTTPX_MAX_CONNECTIONS", "200"))
+HTTPX_MAX_KEEPALIVE = int(os.getenv("HTTPX_MAX_KEEPALIVE", "100"))
+HTTP_LIMITS = httpx.Limits(
+    max_connections=HTTPX_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTPX_MAX_KEEPALIVE,
+    keepalive_expiry=30
+)
+
+# Telegram Bot API endpoints, built once from the token
+TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+SEND_MESSAGE_URL = f"{TELEGRAM_API_URL}/sendMessage"
+SEND_CHAT_ACTION_URL = f"{TELEGRAM_API_URL}/sendChatAction"
+ANSWER_CALLBACK_QUERY_URL = f"{TELEGRAM_API_URL}/answerCallbackQuery"
+EDIT_MESSAGE_TEXT_URL = f"{TELEGRAM_API_URL}/editMessageText"
+
+# Shared client for Telegram Bot API calls; api.telegram.org is reached over
+# TLS, so HTTP/2 lets concurrent calls share one connection
+telegram_client = httpx.AsyncClient(
+    http2=True,
+    timeout=10.0,
+    limits=HTTP_LIMITS
+)
+
 # FastAPI service URL
 FASTAPI_URL = os.getenv("FASTAPI_URL", "http://localhost:8000")
 
-app = FastAPI(title="Telegram Bot Service")
+# Shared client for calls to the FastAPI service so connections are reused
+fastapi_client = httpx.AsyncClient(
+    base_url=FASTAPI_URL,
+    timeout=5.0,
+    limits=HTTP_LIMITS
+)
+
+# Content type for request bodies encoded with orjson.dumps
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Webhook requests for different chats already run concurrently; cap how many
+# Telegram API calls each worker process has in flight at once. This bounds
+# concurrency, not calls per second, so it does not enforce Telegram's rate limit
+TELEGRAM_CONCURRENCY = 30
+telegram_slots = asyncio.Semaphore(TELEGRAM_CONCURRENCY)
+
+# Health probes hit this every few seconds; the body never changes
+HEALTHY_JSON = b'{"status":"healthy"}'
+
+# Travel menu and category data rarely changes, so rendered payloads are
+# reused for this many seconds instead of asking FastAPI on every tap
+TRAVEL_CACHE_TTL = 60.0
+travel_cache: Dict[str, Any] = {}
+
+# Rendered /settings replies are reused per chat for a few seconds so tapping
+# through the settings screens doesn't refetch them; the least recently used
+# chats are evicted once the cache is full
+SETTINGS_CACHE_TTL = 5.0
+SETTINGS_CACHE_SIZE = 10000
+settings_cache: "OrderedDict[str, Any]" = OrderedDict()
+
+# Typing indicators are sent by a fixed pool of workers instead of one task per update.
+# The queue is kept short and indicators older than TYPING_MAX_AGE seconds are
+# dropped, so "typing…" never shows up after the reply under a burst
+TYPING_WORKERS = 4
+TYPING_QUEUE_SIZE = TYPING_WORKERS * 8
+TYPING_MAX_AGE = 1.5
+typing_queue = asyncio.Queue(maxsize=TYPING_QUEUE_SIZE)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    logger.info(
+        "HTTP client limits: max_connections=%s, max_keepalive_connections=%s",
+        HTTPX_MAX_CONNECTIONS, HTTPX_MAX_KEEPALIVE
+    )
+    # Keep strong references so the workers are not garbage collected
+    workers = [asyncio.create_task(typing_worker()) for _ in range(TYPING_WORKERS)]
+    yield
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await fastapi_client.aclose()
+    await telegram_client.aclose()
+
+app = FastAPI(title="Telegram Bot Service", lifespan=lifespan)
 
-class TelegramUpdate(BaseModel):
-    update_id: int
-    message: Optional[dict] = None
-    callback_query: Optional[dict] = None
-    
 class MessageToProcess(BaseModel):
     content: str
     user_id: str
@@ -44,17 +125,26 @@ class InlineKeyboardButton(BaseModel):
 class InlineKeyboardMarkup(BaseModel):
     inline_keyboard: List[List[InlineKeyboardButton]]
 
-# Command handlers
-async def handle_start_command(chat_id: str) -> Dict[str, Any]:
-    """Handle the /start command"""
-    message = (
+class WebhookResponse(BaseModel):
+    status: str
+    command: Optional[str] = None
+    callback_handled: Optional[bool] = None
+    detail: Optional[str] = None
+
+class StatusResponse(BaseModel):
+    status: str
+
+# Replies to /start and /help never change, so they are built once at import
+# and shared by every call. Callers only read them.
+START_PAYLOAD = {
+    "text": (
         "👋 *Welcome to the Travel Bot!*\n\n"
         "I'm here to help you plan your next adventure.\n\n"
         "Use the buttons below to explore options or check your settings."
-    )
-    
-    # Create inline keyboard with Menu and Settings buttons
-    keyboard = {
+    ),
+    "parse_mode": "Markdown",
+    # Inline keyboard with Menu and Settings buttons
+    "reply_markup": {
         "inline_keyboard": [
             [
                 {"text": "🗺️ Travel Menu", "callback_data": "menu_main"},
@@ -62,16 +152,10 @@ async def handle_start_command(chat_id: str) -> Dict[str, Any]:
             ]
         ]
     }
-    
-    return {
-        "text": message,
-        "parse_mode": "Markdown",
-        "reply_markup": keyboard
-    }
+}
 
-async def handle_help_command(chat_id: str) -> Dict[str, Any]:
-    """Handle the /help command"""
-    message = (
+HELP_PAYLOAD = {
+    "text": (
         "🔍 *Help Information*\n\n"
         "This bot helps you explore travel options and manage your preferences.\n\n"
         "Available commands:\n"
@@ -81,25 +165,47 @@ async def handle_help_command(chat_id: str) -> Dict[str, Any]:
         "• /menu - Show the travel menu\n"
         "• /settings - Show your settings\n\n"
         "You can also use the inline buttons for navigation."
-    )
-    
-    return {
-        "text": message,
-        "parse_mode": "Markdown"
-    }
+    ),
+    "parse_mode": "Markdown"
+}
+
+# Inline keyboard for the settings options shown under the user's settings
+SETTINGS_KEYBOARD = {
+    "inline_keyboard": [
+        [
+            {"text": "🌍 Language", "callback_data": "settings_language"},
+            {"text": "🔔 Notifications", "callback_data": "settings_notifications"}
+        ],
+        [
+            {"text": "💰 Currency", "callback_data": "settings_currency"},
+            {"text": "🕒 Time Format", "callback_data": "settings_time_format"}
+        ],
+        [
+            {"text": "🔙 Back to Main Menu", "callback_data": "back_to_main"}
+        ]
+    ]
+}
+
+# Command handlers
+async def handle_start_command(chat_id: str) -> Dict[str, Any]:
+    """Handle the /start command"""
+    return START_PAYLOAD
+
+async def handle_help_command(chat_id: str) -> Dict[str, Any]:
+    """Handle the /help command"""
+    return HELP_PAYLOAD
 
 async def handle_status_command(chat_id: str) -> Dict[str, Any]:
     """Handle the /status command by checking all services"""
     try:
         # Check FastAPI service
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{FASTAPI_URL}/health")
-            if response.status_code == 200:
-                message = "✅ *All systems operational*\n\nThe bot is functioning normally and all services are available."
-            else:
-                message = "⚠️ *Partial system outage*\n\nSome services may be unavailable. Please try again later."
+        response = await fastapi_client.get("/health")
+        if response.status_code == 200:
+            message = "✅ *All systems operational*\n\nThe bot is functioning normally and all services are available."
+        else:
+            message = "⚠️ *Partial system outage*\n\nSome services may be unavailable. Please try again later."
     except Exception as e:
-        logger.error(f"Error checking status: {str(e)}")
+        logger.error("Error checking status: %s", e)
         message = "❌ *System outage*\n\nThe system is currently experiencing issues. Please try again later."
     
     return {
@@ -107,53 +213,68 @@ async def handle_status_command(chat_id: str) -> Dict[str, Any]:
         "parse_mode": "Markdown"
     }
 
+def get_cached_travel_payload(key: str) -> Optional[Dict[str, Any]]:
+    """Return a cached travel payload if it has not expired"""
+    entry = travel_cache.get(key)
+    if entry and time.monotonic() < entry[0]:
+        return entry[1]
+    return None
+
+def cache_travel_payload(key: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Cache a rendered travel payload and return it"""
+    travel_cache[key] = (time.monotonic() + TRAVEL_CACHE_TTL, payload)
+    return payload
+
 async def handle_menu_command(chat_id: str) -> Dict[str, Any]:
     """Handle the /menu command"""
+    cached = get_cached_travel_payload("menu")
+    if cached:
+        return cached
+    
     try:
         # Fetch menu data from FastAPI
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{FASTAPI_URL}/api/travel/menu")
+        response = await fastapi_client.get("/api/travel/menu")
+        
+        if response.status_code == 200:
+            menu_data = response.json()
             
-            if response.status_code == 200:
-                menu_data = response.json()
-                
-                # Format the menu message
-                message = "🗺️ *Travel Menu*\n\n"
+            # Format the menu message
+            message = "🗺️ *Travel Menu*\n\n"
+            
+            # Add menu items with inline buttons
+            keyboard = {"inline_keyboard": []}
+            
+            for category in menu_data.get("categories", []):
+                message += f"*{category['name']}*\n"
                 
-                # Add menu items with inline buttons
-                keyboard = {"inline_keyboard": []}
+                # Add category items to message
+                for item in category.get("items", []):
+                    message += f"• {item['name']}: {item['description']}\n"
                 
-                for category in menu_data.get("categories", []):
-                    message += f"*{category['name']}*\n"
-                    
-                    # Add category items to message
-                    for item in category.get("items", []):
-                        message += f"• {item['name']}: {item['description']}\n"
-                    
-                    message += "\n"
-                    
-                    # Add category button
-                    keyboard["inline_keyboard"].append([
-                        {"text": f"Browse {category['name']}", "callback_data": f"menu_category_{category['id']}"}
-                    ])
+                message += "\n"
                 
-                # Add back button
+                # Add category button
                 keyboard["inline_keyboard"].append([
-                    {"text": "🔙 Back to Main Menu", "callback_data": "back_to_main"}
+                    {"text": f"Browse {category['name']}", "callback_data": f"menu_category_{category['id']}"}
                 ])
-                
-                return {
-                    "text": message,
-                    "parse_mode": "Markdown",
-                    "reply_markup": keyboard
-                }
-            else:
-                return {
-                    "text": "Sorry, I couldn't fetch the menu. Please try again later.",
-                    "parse_mode": "Markdown"
-                }
+            
+            # Add back button
+            keyboard["inline_keyboard"].append([
+                {"text": "🔙 Back to Main Menu", "callback_data": "back_to_main"}
+            ])
+            
+            return cache_travel_payload("menu", {
+                "text": message,
+                "parse_mode": "Markdown",
+                "reply_markup": keyboard
+            })
+        else:
+            return {
+                "text": "Sorry, I couldn't fetch the menu. Please try again later.",
+                "parse_mode": "Markdown"
+            }
     except Exception as e:
-        logger.error(f"Error fetching menu: {str(e)}")
+        logger.error("Error fetching menu: %s", e)
         return {
             "text": "Sorry, there was an error fetching the menu. Please try again later.",
             "parse_mode": "Markdown"
@@ -161,50 +282,42 @@ async def handle_menu_command(chat_id: str) -> Dict[str, Any]:
 
 async def handle_settings_command(chat_id: str) -> Dict[str, Any]:
     """Handle the /settings command"""
+    entry = settings_cache.get(chat_id)
+    if entry and time.monotonic() < entry[0]:
+        settings_cache.move_to_end(chat_id)
+        return entry[1]
+    
     try:
         # Fetch settings data from FastAPI
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{FASTAPI_URL}/api/users/{chat_id}/settings")
+        response = await fastapi_client.get(f"/api/users/{chat_id}/settings")
+        
+        if response.status_code == 200:
+            settings_data = response.json()
             
-            if response.status_code == 200:
-                settings_data = response.json()
-                
-                # Format the settings message
-                message = "⚙️ *Your Settings*\n\n"
-                
-                # Add settings items
-                for key, value in settings_data.get("settings", {}).items():
-                    message += f"*{key}*: {value}\n"
-                
-                # Create inline keyboard for settings options
-                keyboard = {
-                    "inline_keyboard": [
-                        [
-                            {"text": "🌍 Language", "callback_data": "settings_language"},
-                            {"text": "🔔 Notifications", "callback_data": "settings_notifications"}
-                        ],
-                        [
-                            {"text": "💰 Currency", "callback_data": "settings_currency"},
-                            {"text": "🕒 Time Format", "callback_data": "settings_time_format"}
-                        ],
-                        [
-                            {"text": "🔙 Back to Main Menu", "callback_data": "back_to_main"}
-                        ]
-                    ]
-                }
-                
-                return {
-                    "text": message,
-                    "parse_mode": "Markdown",
-                    "reply_markup": keyboard
-                }
-            else:
-                return {
-                    "text": "Sorry, I couldn't fetch your settings. Please try again later.",
-                    "parse_mode": "Markdown"
-                }
+            # Format the settings message
+            message = "⚙️ *Your Settings*\n\n"
+            
+            # Add settings items
+            for key, value in settings_data.get("settings", {}).items():
+                message += f"*{key}*: {value}\n"
+            
+            payload = {
+                "text": message,
+                "parse_mode": "Markdown",
+                "reply_markup": SETTINGS_KEYBOARD
+            }
+            settings_cache[chat_id] = (time.monotonic() + SETTINGS_CACHE_TTL, payload)
+            settings_cache.move_to_end(chat_id)
+            if len(settings_cache) > SETTINGS_CACHE_SIZE:
+                settings_cache.popitem(last=False)
+            return payload
+        else:
+            return {
+                "text": "Sorry, I couldn't fetch your settings. Please try again later.",
+                "parse_mode": "Markdown"
+            }
     except Exception as e:
-        logger.error(f"Error fetching settings: {str(e)}")
+        logger.error("Error fetching settings: %s", e)
         return {
             "text": "Sorry, there was an error fetching your settings. Please try again later.",
             "parse_mode": "Markdown"
@@ -236,59 +349,62 @@ async def handle_menu_callback(chat_id: str, callback_data: str) -> Dict[str, An
             return {"text": "Invalid menu selection. Please try again."}
         
         category_id = parts[2]
+        cache_key = f"category_{category_id}"
+        cached = get_cached_travel_payload(cache_key)
+        if cached:
+            return cached
         
         # Fetch category details from FastAPI
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{FASTAPI_URL}/api/travel/categories/{category_id}")
+        response = await fastapi_client.get(f"/api/travel/categories/{category_id}")
+        
+        if response.status_code == 200:
+            category_data = response.json()
             
-            if response.status_code == 200:
-                category_data = response.json()
-                
-                # Format the category message
-                message = f"🗺️ *{category_data.get('name', 'Category')}*\n\n"
-                message += f"{category_data.get('description', '')}\n\n"
-                
-                # Add items
-                for item in category_data.get("items", []):
-                    message += f"*{item['name']}*\n"
-                    message += f"{item['description']}\n"
-                    if 'price' in item:
-                        message += f"Price: {item['price']}\n"
-                    message += "\n"
-                
-                # Create inline keyboard for navigation
-                keyboard = {
-                    "inline_keyboard": [
-                        [
-                            {"text": "🔙 Back to Menu", "callback_data": "menu_main"}
-                        ]
+            # Format the category message
+            message = f"🗺️ *{category_data.get('name', 'Category')}*\n\n"
+            message += f"{category_data.get('description', '')}\n\n"
+            
+            # Add items
+            for item in category_data.get("items", []):
+                message += f"*{item['name']}*\n"
+                message += f"{item['description']}\n"
+                if 'price' in item:
+                    message += f"Price: {item['price']}\n"
+                message += "\n"
+            
+            # Create inline keyboard for navigation
+            keyboard = {
+                "inline_keyboard": [
+                    [
+                        {"text": "🔙 Back to Menu", "callback_data": "menu_main"}
                     ]
-                }
-                
-                return {
-                    "text": message,
-                    "parse_mode": "Markdown",
-                    "reply_markup": keyboard
-                }
-            else:
-                return {
-                    "text": "Sorry, I couldn't fetch the category details. Please try again later.",
-                    "parse_mode": "Markdown"
-                }
+                ]
+            }
+            
+            return cache_travel_payload(cache_key, {
+                "text": message,
+                "parse_mode": "Markdown",
+                "reply_markup": keyboard
+            })
+        else:
+            return {
+                "text": "Sorry, I couldn't fetch the category details. Please try again later.",
+                "parse_mode": "Markdown"
+            }
     except Exception as e:
-        logger.error(f"Error fetching category: {str(e)}")
+        logger.error("Error fetching category: %s", e)
         return {
             "text": "Sorry, there was an error fetching the category details. Please try again later.",
             "parse_mode": "Markdown"
         }
 
-async def handle_settings_callback(chat_id: str, callback_data: str) -> Dict[str, Any]:
-    """Handle settings-related callbacks"""
-    setting_type = callback_data.split('_')[1] if len(callback_data.split('_')) > 1 else None
-    
-    if setting_type == "language":
-        message = "*🌍 Language Settings*\n\nSelect your preferred language:"
-        keyboard = {
+# Settings sub-menus are static, so their payloads are built once at import
+# and shared by every callback. Callers only read them.
+SETTINGS_PAYLOADS = {
+    "language": {
+        "text": "*🌍 Language Settings*\n\nSelect your preferred language:",
+        "parse_mode": "Markdown",
+        "reply_markup": {
             "inline_keyboard": [
                 [
                     {"text": "English 🇬🇧", "callback_data": "set_language_en"},
@@ -303,9 +419,11 @@ async def handle_settings_callback(chat_id: str, callback_data: str) -> Dict[str
                 ]
             ]
         }
-    elif setting_type == "notifications":
-        message = "*🔔 Notification Settings*\n\nChoose which notifications you want to receive:"
-        keyboard = {
+    },
+    "notifications": {
+        "text": "*🔔 Notification Settings*\n\nChoose which notifications you want to receive:",
+        "parse_mode": "Markdown",
+        "reply_markup": {
             "inline_keyboard": [
                 [
                     {"text": "Deals & Offers ✅", "callback_data": "toggle_notif_deals"}
@@ -321,9 +439,11 @@ async def handle_settings_callback(chat_id: str, callback_data: str) -> Dict[str
                 ]
             ]
         }
-    elif setting_type == "currency":
-        message = "*💰 Currency Settings*\n\nSelect your preferred currency:"
-        keyboard = {
+    },
+    "currency": {
+        "text": "*💰 Currency Settings*\n\nSelect your preferred currency:",
+        "parse_mode": "Markdown",
+        "reply_markup": {
             "inline_keyboard": [
                 [
                     {"text": "USD 🇺🇸", "callback_data": "set_currency_usd"},
@@ -338,9 +458,11 @@ async def handle_settings_callback(chat_id: str, callback_data: str) -> Dict[str
                 ]
             ]
         }
-    elif setting_type == "time_format":
-        message = "*🕒 Time Format Settings*\n\nSelect your preferred time format:"
-        keyboard = {
+    },
+    "time_format": {
+        "text": "*🕒 Time Format Settings*\n\nSelect your preferred time format:",
+        "parse_mode": "Markdown",
+        "reply_markup": {
             "inline_keyboard": [
                 [
                     {"text": "12-hour (AM/PM)", "callback_data": "set_time_12h"}
@@ -353,96 +475,135 @@ async def handle_settings_callback(chat_id: str, callback_data: str) -> Dict[str
                 ]
             ]
         }
-    else:
+    },
+}
+
+async def handle_settings_callback(chat_id: str, callback_data: str) -> Dict[str, Any]:
+    """Handle settings-related callbacks"""
+    # Everything after the "settings_" prefix, e.g. "time_format"
+    setting_type = callback_data.partition('_')[2]
+    
+    payload = SETTINGS_PAYLOADS.get(setting_type)
+    if payload is None:
         # Default to main settings
         return await handle_settings_command(chat_id)
     
-    return {
-        "text": message,
-        "parse_mode": "Markdown",
-        "reply_markup": keyboard
-    }
+    return payload
 
-# Callback query mapping
+async def handle_back_callback(chat_id: str, callback_data: str) -> Dict[str, Any]:
+    """Handle the back_to_main callback by returning to the main menu"""
+    return await handle_start_command(chat_id)
+
+# Callback query mapping, keyed by the callback_data prefix
 CALLBACK_HANDLERS = {
     "menu": handle_menu_callback,
     "settings": handle_settings_callback,
+    "back": handle_back_callback,
 }
 
+async def call_telegram(url: str, payload: Dict[str, Any]) -> httpx.Response:
+    """POST a JSON payload to a Telegram Bot API method"""
+    async with telegram_slots:
+        return await telegram_client.post(url, content=orjson.dumps(payload), headers=JSON_HEADERS)
+
 async def send_typing_action(chat_id: str):
     """Send typing action to Telegram"""
     try:
-        async with httpx.AsyncClient() as client:
-            await client.post(
-                f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendChatAction",
-                json={"chat_id": chat_id, "action": "typing"}
-            )
+        await call_telegram(SEND_CHAT_ACTION_URL, {"chat_id": chat_id, "action": "typing"})
     except Exception as e:
-        logger.error(f"Error sending typing action: {str(e)}")
+        logger.error("Error sending typing action: %s", e)
+
+async def typing_worker():
+    """Send queued typing indicators until cancelled"""
+    while True:
+        chat_id, queued_at = await typing_queue.get()
+        try:
+            if time.monotonic() - queued_at <= TYPING_MAX_AGE:
+                await send_typing_action(chat_id)
+        finally:
+            typing_queue.task_done()
+
+def queue_typing_action(chat_id: str):
+    """Queue a typing indicator, dropping it if the queue is full"""
+    try:
+        typing_queue.put_nowait((chat_id, time.monotonic()))
+    except asyncio.QueueFull:
+        logger.warning("Typing queue full, skipping typing action for %s", chat_id)
 
-@app.post("/webhook")
-async def telegram_webhook(update: TelegramUpdate):
+@app.post("/webhook", response_model=WebhookResponse, response_model_exclude_none=True)
+async def telegram_webhook(request: Request):
+    # Parse the update with orjson instead of validating it into a model
+    try:
+        update = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(update, dict):
+        raise HTTPException(status_code=400, detail="Update must be a JSON object")
+    if not isinstance(update.get("update_id"), int):
+        raise HTTPException(status_code=400, detail="Update must have an integer update_id")
+    
+    # Only button clicks and text messages are handled; return early for
+    # every other update type (edits, joins, polls, ...)
+    callback_query = update.get("callback_query")
+    message = update.get("message")
+    if not isinstance(callback_query, (dict, type(None))) or not isinstance(message, (dict, type(None))):
+        raise HTTPException(status_code=400, detail="callback_query and message must be JSON objects")
+    if not callback_query and not (message and "text" in message):
+        return {"status": "no message text"}
+    
     try:
         # Handle callback queries (button clicks)
-        if update.callback_query:
-            callback_query = update.callback_query
+        if callback_query:
             callback_data = callback_query.get("data", "")
             chat_id = str(callback_query.get("message", {}).get("chat", {}).get("id", ""))
             
-            logger.info(f"Received callback query from {chat_id}: {callback_data}")
+            logger.info("Received callback query from %s: %s", chat_id, callback_data)
             
             # Send typing indicator
-            asyncio.create_task(send_typing_action(chat_id))
+            queue_typing_action(chat_id)
             
-            # Acknowledge the callback query
-            async with httpx.AsyncClient() as client:
-                await client.post(
-                    f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                    json={"callback_query_id": callback_query.get("id", "")}
-                )
-            
-            # Handle different callback types
-            if callback_data == "back_to_main":
-                # Return to main menu
-                response_data = await handle_start_command(chat_id)
-            else:
-                # Extract the callback type (menu, settings, etc.)
-                callback_type = callback_data.split('_')[0] if '_' in callback_data else ""
+            # Acknowledge the callback query while the handler runs, so the
+            # button spinner stops without waiting on the handler's own calls
+            ack_task = asyncio.create_task(
+                call_telegram(ANSWER_CALLBACK_QUERY_URL, {"callback_query_id": callback_query.get("id", "")})
+            )
+            try:
+                # Extract the callback type (menu, settings, back, etc.)
+                callback_type, separator, _ = callback_data.partition('_')
+                handler = CALLBACK_HANDLERS.get(callback_type) if separator else None
                 
-                if callback_type in CALLBACK_HANDLERS:
-                    response_data = await CALLBACK_HANDLERS[callback_type](chat_id, callback_data)
+                if handler:
+                    response_data = await handler(chat_id, callback_data)
                 else:
                     response_data = {
                         "text": "Sorry, I don't know how to handle this action.",
                         "parse_mode": "Markdown"
                     }
+            finally:
+                # A failed acknowledgement shouldn't fail the update
+                ack_result, = await asyncio.gather(ack_task, return_exceptions=True)
+                if isinstance(ack_result, Exception):
+                    logger.error("Error answering callback query: %s", ack_result)
             
             # Edit the original message with the new content
-            async with httpx.AsyncClient() as client:
-                await client.post(
-                    f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/editMessageText",
-                    json={
-                        "chat_id": chat_id,
-                        "message_id": callback_query.get("message", {}).get("message_id", ""),
-                        "text": response_data.get("text", ""),
-                        "parse_mode": response_data.get("parse_mode", ""),
-                        "reply_markup": response_data.get("reply_markup", {})
-                    }
-                )
+            await call_telegram(EDIT_MESSAGE_TEXT_URL, {
+                "chat_id": chat_id,
+                "message_id": callback_query.get("message", {}).get("message_id", ""),
+                "text": response_data.get("text", ""),
+                "parse_mode": response_data.get("parse_mode", ""),
+                "reply_markup": response_data.get("reply_markup", {})
+            })
             
             return {"status": "success", "callback_handled": True}
         
         # Handle regular messages
-        if not update.message or "text" not in update.message:
-            return {"status": "no message text"}
-        
-        chat_id = str(update.message.get("chat", {}).get("id"))
-        message_text = update.message.get("text", "")
+        chat_id = str(message.get("chat", {}).get("id"))
+        message_text = message.get("text", "")
         
-        logger.info(f"Received message from {chat_id}: {message_text}")
+        logger.info("Received message from %s: %s", chat_id, message_text)
         
         # Send typing indicator
-        asyncio.create_task(send_typing_action(chat_id))
+        queue_typing_action(chat_id)
         
         # Check if this is a command
         if message_text.startswith('/'):
@@ -451,37 +612,33 @@ async def telegram_webhook(update: TelegramUpdate):
                 response_data = await COMMAND_HANDLERS[command](chat_id)
                 
                 # Send response directly for commands
-                async with httpx.AsyncClient() as client:
-                    await client.post(
-                        f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
-                        json={
-                            "chat_id": chat_id,
-                            "text": response_data.get("text", ""),
-                            "parse_mode": response_data.get("parse_mode", ""),
-                            "reply_markup": response_data.get("reply_markup", {})
-                        }
-                    )
+                await call_telegram(SEND_MESSAGE_URL, {
+                    "chat_id": chat_id,
+                    "text": response_data.get("text", ""),
+                    "parse_mode": response_data.get("parse_mode", ""),
+                    "reply_markup": response_data.get("reply_markup", {})
+                })
                 return {"status": "success", "command": command}
         
         # For regular messages, send to FastAPI for processing
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{FASTAPI_URL}/process",
-                json={"content": message_text, "user_id": chat_id}
-            )
+        response = await fastapi_client.post(
+            "/process",
+            content=orjson.dumps({"content": message_text, "user_id": chat_id}),
+            headers=JSON_HEADERS
+        )
+        
+        if response.status_code != 200:
+            logger.error("Error from FastAPI: %s", response.text)
             
-            if response.status_code != 200:
-                logger.error(f"Error from FastAPI: {response.text}")
-                
-                # Send error message to user
-                error_message = "Sorry, I couldn't process your message. Please try again later."
-                await send_message(MessageToSend(user_id=chat_id, content=error_message))
-                
-                return {"status": "error", "detail": "Failed to process message"}
+            # Send error message to user
+            error_message = "Sorry, I couldn't process your message. Please try again later."
+            await send_message(MessageToSend(user_id=chat_id, content=error_message))
+            
+            return {"status": "error", "detail": "Failed to process message"}
         
         return {"status": "success"}
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
+        logger.error("Error processing webhook: %s", e)
         
         # Try to send error message to user if possible
         try:
@@ -493,46 +650,47 @@ async def telegram_webhook(update: TelegramUpdate):
             
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/send")
+@app.post("/send", response_model=StatusResponse)
 async def send_message(message: MessageToSend):
     try:
+        # Prepare request data
+        request_data = {
+            "chat_id": message.user_id,
+            "text": message.content
+        }
+        
+        # Add parse_mode if provided
+        if message.parse_mode:
+            request_data["parse_mode"] = message.parse_mode
+        
+        # Add reply_markup if provided
+        if message.reply_markup:
+            request_data["reply_markup"] = message.reply_markup
+        
         # Send message to Telegram
-        async with httpx.AsyncClient() as client:
-            telegram_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-            
-            # Prepare request data
-            request_data = {
-                "chat_id": message.user_id,
-                "text": message.content
-            }
-            
-            # Add parse_mode if provided
-            if message.parse_mode:
-                request_data["parse_mode"] = message.parse_mode
-            
-            # Add reply_markup if provided
-            if message.reply_markup:
-                request_data["reply_markup"] = message.reply_markup
-            
-            response = await client.post(
-                telegram_url,
-                json=request_data
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Error sending message to Telegram: {response.text}")
-                raise HTTPException(status_code=500, detail="Failed to send message to Telegram")
-            
-            logger.info(f"Successfully sent message to user {message.user_id}")
+        response = await call_telegram(SEND_MESSAGE_URL, request_data)
+        
+        if response.status_code != 200:
+            logger.error("Error sending message to Telegram: %s", response.text)
+            # Telegram rejected the message itself (e.g. the user blocked the
+            # bot), so pass the 4xx through; retrying would never succeed.
+            # Rate limits and Telegram-side errors stay 5xx so they are retried.
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                raise HTTPException(status_code=response.status_code, detail="Telegram rejected the message")
+            raise HTTPException(status_code=500, detail="Failed to send message to Telegram")
+        
+        logger.info("Successfully sent message to user %s", message.user_id)
         
         return {"status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error sending message: {str(e)}")
+        logger.error("Error sending message: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return Response(content=HEALTHY_JSON, media_type="application/json")
 
 # For local development
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+from unittest import mock
+from fastapi.testclient import TestClient
+
+# Import app after environment variables are set in conftest.py
+from app.main import (
+    app, handle_settings_callback, handle_menu_callback, handle_settings_command,
+    SETTINGS_PAYLOADS, travel_cache, settings_cache,
+    START_PAYLOAD, EDIT_MESSAGE_TEXT_URL
+)
+
+async def test_settings_callback_returns_static_payload():
+    """Test that settings sub-menus are served from the prebuilt payloads."""
+    response = await handle_settings_callback("123", "settings_currency")
+    assert response is SETTINGS_PAYLOADS["currency"]
+    assert response["parse_mode"] == "Markdown"
+
+async def test_settings_callback_handles_underscored_setting():
+    """Test that setting types containing underscores reach their sub-menu."""
+    response = await handle_settings_callback("123", "settings_time_format")
+    assert response is SETTINGS_PAYLOADS["time_format"]
+
+async def test_menu_callback_reuses_cached_category():
+    """Test that a recently rendered category is served without calling FastAPI."""
+    payload = {"text": "cached", "parse_mode": "Markdown"}
+    with mock.patch.dict(travel_cache, {"category_paris": (float("inf"), payload)}), \
+            mock.patch("app.main.fastapi_client") as mock_client:
+        response = await handle_menu_callback("123", "menu_category_paris")
+    assert response is payload
+    mock_client.get.assert_not_called()
+
+def test_back_to_main_dispatches_to_start():
+    """Test that back_to_main is routed through CALLBACK_HANDLERS to the main menu."""
+    with mock.patch("app.main.call_telegram", new_callable=mock.AsyncMock) as mock_call:
+        response = TestClient(app).post("/webhook", json={
+            "update_id": 1,
+            "callback_query": {"id": "1", "data": "back_to_main", "message": {"message_id": 2, "chat": {"id": 123}}}
+        })
+    assert response.json() == {"status": "success", "callback_handled": True}
+    edit_url, edit_payload = mock_call.call_args.args
+    assert edit_url == EDIT_MESSAGE_TEXT_URL
+    assert edit_payload["text"] == START_PAYLOAD["text"]
+
+async def test_settings_command_caches_per_chat():
+    """Test that a chat's settings are fetched once within the cache TTL."""
+    with mock.patch.dict(settings_cache, clear=True), \
+            mock.patch("app.main.fastapi_client") as mock_client:
+        mock_client.get = mock.AsyncMock(return_value=mock.Mock(
+            status_code=200, json=lambda: {"user_id": "123", "settings": {"Theme": "Light"}}
+        ))
+        first = await handle_settings_command("123")
+        second = await handle_settings_command("123")
+    assert first is second
+    assert "*Theme*: Light" in first["text"]
+    mock_client.get.assert_awaited_once()
+
+def test_webhook_ignores_updates_without_text_or_callback():
+    """Test that unhandled update types return early without calling Telegram."""
+    with mock.patch("app.main.call_telegram", new_callable=mock.AsyncMock) as mock_call:
+        response = TestClient(app).post("/webhook", json={"update_id": 1, "edited_message": {"text": "hi"}})
+    assert response.json() == {"status": "no message text"}
+    mock_call.assert_not_called()
+
+def test_send_passes_through_telegram_rejections():
+    """Test that /send returns Telegram's 4xx so the subscriber acks instead of retrying."""
+    with mock.patch("app.main.call_telegram", new_callable=mock.AsyncMock) as mock_call:
+        mock_call.return_value = mock.Mock(status_code=403, text="Forbidden: bot was blocked by the user")
+        blocked = TestClient(app).post("/send", json={"user_id": "123", "content": "hi"})
+        mock_call.return_value = mock.Mock(status_code=429, text="Too Many Requests")
+        limited = TestClient(app).post("/send", json={"user_id": "123", "content": "hi"})
+    assert blocked.status_code == 403
+    assert limited.status_code == 500
+
+def test_webhook_rejects_malformed_updates():
+    """Test that updates with the wrong shape get a 400 instead of crashing the handler."""
+    client = TestClient(app)
+    assert client.post("/webhook", json={"update_id": 1, "callback_query": "x"}).status_code == 400
+    assert client.post("/webhook", json={"update_id": 1, "message": "text"}).status_code == 400
+    assert client.post("/webhook", json={"message": {"text": "hi"}}).status_code == 400